@@ -1,47 +1,68 @@
 #include <type_traits>
+#include <cuda_bf16.h>
 #include "cuda_util.h"
 #include "tea.h"
 #include "tensor_view.h"
 
-#define SamplingNonZeros 0
-#define SamplingZeros    1
-
 extern "C" {
 
-__global__ void rbf_expansion_ensemble_sparse_stochgrad_${GOAL}(
+__device__ __inline__ uint hitmap_hash(int i, int j) {
+    constexpr static int NH = ${NH};  // number of entries in the hitmap
+    return TEA::get_1x32<8>(i, j) % NH;
+}
+
+// mark the locations of all non-zeros of the target in the hitmap
+__global__ void rbf_expansion_ensemble_sparse_hitmap(
+    int   * __restrict hitmap,
+    int   * __restrict nz_i,
+    int   * __restrict nz_j
+) {
+    constexpr static int NNZ = ${NNZ}; // number of non-zeros in the target
+
+    for(int q = threadIdx.x + blockIdx.x * blockDim.x; q < NNZ; q += blockDim.x * gridDim.x) {
+        auto h = hitmap_hash(nz_i[q], nz_j[q]);
+        atomicOr(hitmap + h / 32, 1 << (h % 32));
+    }
+}
+
+__global__ void rbf_expansion_ensemble_sparse_stochgrad(
     uint  * __restrict rng_key,
     int   * __restrict hitmap,
-    int2  * __restrict nz_indices,
+    int   * __restrict nz_i,
+    int   * __restrict nz_j,
     float * __restrict nz_values,
-    float * __restrict ptr_u,
-    float * __restrict ptr_v,
-    float * __restrict ptr_a,
-    float * __restrict ptr_b,
+    __nv_bfloat16 * __restrict ptr_u,
+    __nv_bfloat16 * __restrict ptr_v,
+    __nv_bfloat16 * __restrict ptr_a,
+    __nv_bfloat16 * __restrict ptr_b,
     float * __restrict ptr_L,
     float * __restrict ptr_du,
     float * __restrict ptr_dv,
     float * __restrict ptr_da,
     float * __restrict ptr_db,
-    const int  n
+    const int  n_nonzeros,
+    const int  n_zeros
 ) {
     constexpr static int E   = ${E};   // number of instances in ensemble
     constexpr static int N   = ${N};   // number of matrix rows
     constexpr static int M   = ${M};   // number of matrix columns
     constexpr static int R   = ${R};   // number of RBF components
     constexpr static int NNZ = ${NNZ}; // number of non-zeros in the target
-    constexpr static int NH  = ${NH};  // number of entries in the hitmap
 
     /*---------------------------------------------------
     a kernel call = an ensemble of instances
-    an instance   = several CUDA blocks
+    an instance   = several CUDA blocks sampling the non-zeros
+                  + several CUDA blocks sampling the zeros
     a block       = loop over tiles of the target matrix
     ---------------------------------------------------*/
 
     constexpr static int thread_per_block = ${thread_per_block}; // == blockDim.x;
-    constexpr static int block_per_inst   = ${block_per_inst};   // == gridDim.x;
+    constexpr static int block_per_inst   = ${block_per_inst};   // == gridDim.x / 2;
     const int i_thread   = threadIdx.x;
-    const int i_block    = blockIdx.x;
+    const int i_block    = blockIdx.x % block_per_inst;
     const int i_instance = blockIdx.y;
+    const bool sampling_nonzeros = blockIdx.x < block_per_inst;
+    const int n          = sampling_nonzeros ? n_nonzeros : n_zeros;
     const int lane       = i_thread % warp_size;
 
     auto  u = tensor_view<MemoryLayout::Fortran>(ptr_u,  N,    R, E);
@@ -75,27 +96,23 @@ __global__ void rbf_expansion_ensemble_sparse_stochgrad_${GOAL}(
 
         __debug__
 
-        #if ${GOAL} == SamplingNonZeros
+        int i, j;
+        float Aij;
 
-            auto q   = TEA::get_1x32<8>(key, p) % NNZ;
-            auto Aij = nz_values [q];
-            auto ij  = nz_indices[q];
-            int  i   = ij.x;
-            int  j   = ij.y;
+        // the branch is uniform across each block
+        if (sampling_nonzeros) {
 
-            auto set_bit = [](auto H, auto i, auto j){
-                auto h = TEA::get_1x32<8>(i, j) % NH;
-                atomicOr(H + h / 32, 1 << (h % 32));
-            };
-            set_bit(hitmap, i, j);
+            auto q = TEA::get_1x32<8>(key, p) % NNZ;
+            Aij    = nz_values[q];
+            i      = nz_i[q];
+            j      = nz_j[q];
 
-        #elif ${GOAL} == SamplingZeros
+        } else {
 
-            int i, j;
-            auto Aij = 0.f;
+            Aij = 0.f;
 
             auto is_bit_set = [](auto H, auto i, auto j){
-                auto h = TEA::get_1x32<8>(i, j) % NH;
+                auto h = hitmap_hash(i, j);
                 return H[h / 32] & (1 << (h % 32));
             };
             auto tea = make_uint2(key, p);
@@ -106,7 +123,7 @@ __global__ void rbf_expansion_ensemble_sparse_stochgrad_${GOAL}(
                 __debug__
             } while (is_bit_set(hitmap, i, j));
 
-        #endif
+        }
 
         __debug__
 
@@ -115,12 +132,14 @@ __global__ void rbf_expansion_ensemble_sparse_stochgrad_${GOAL}(
         // evaluate the RBF components
         __debug__
 
-        A_local = b(i_instance);
+        // parameters are stored as BF16, all arithmetics are done in FP32
+        A_local = __bfloat162float(b(i_instance));
         #pragma unroll (R)
         for(int k = 0; k < R; ++k) {
-            auto d = u(i, k, i_instance) - v(j, k, i_instance);
+            auto d = __bfloat162float(u(i, k, i_instance)) -
+                     __bfloat162float(v(j, k, i_instance));
             auto eij = expf(-d * d);
-            A_local += a(k, i_instance) * eij;
+            A_local += __bfloat162float(a(k, i_instance)) * eij;
         }
 
         __debug__
@@ -143,9 +162,10 @@ __global__ void rbf_expansion_ensemble_sparse_stochgrad_${GOAL}(
 
         for(int k = 0; k < R; ++k) {
             __debug__
-            auto d = u(i, k, i_instance) - v(j, k, i_instance);
+            auto d = __bfloat162float(u(i, k, i_instance)) -
+                     __bfloat162float(v(j, k, i_instance));
             auto eij = expf(-d * d);
-            auto duv = -2.f * dA_local * a(k, i_instance) * eij * d;
+            auto duv = -2.f * dA_local * __bfloat162float(a(k, i_instance)) * eij * d;
 
             auto delta_u = duv;
             auto delta_v = -duv;
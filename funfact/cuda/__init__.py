@@ -3,7 +3,7 @@
 import pycuda.driver as cuda
 from ._array import ManagedArray
 from ._context import context_manager
-from ._jit import jit
+from ._jit import jit, jit_module
 
 
 _cuda_initialized = False
@@ -12,4 +12,4 @@ if not _cuda_initialized:
     _cuda_initialized = True
 
 
-__all__ = ['jit', 'context_manager', 'ManagedArray']
+__all__ = ['jit', 'jit_module', 'context_manager', 'ManagedArray']
@@ -4,7 +4,7 @@ from pycuda.compiler import SourceModule
 import funfact.cpp
 
 
-def jit(source, name, *compiler_options, **pycuda_options):
+def jit_module(source, *compiler_options, **pycuda_options):
     return SourceModule(
         source,
         options=['-std=c++14',
@@ -19,4 +19,10 @@ def jit(source, name, *compiler_options, **pycuda_options):
         no_extern_c=True,
         # keep=True,
         **pycuda_options
+    )
+
+
+def jit(source, name, *compiler_options, **pycuda_options):
+    return jit_module(
+        source, *compiler_options, **pycuda_options
     ).get_function(name)
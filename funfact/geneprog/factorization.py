@@ -3,7 +3,6 @@
 import re
 from treelib import Tree
 import torch
-from funfact.util.iterable import flatten_dict
 
 '''
 Long-term TODO list:
@@ -99,7 +98,23 @@ class Factorization:
     def parameters(self):
         '''A flattened list of optimizable parameters of the primitive and all
         its children. It can be directly plugged into a PyTorch optimizer.'''
-        return flatten_dict(self.parameters_dict)
+        return tuple(getattr(p, name) for p, name in self._parameter_refs)
+
+    @property
+    def _parameter_refs(self):
+        '''The (primitive, parameter name) pairs in the order of
+        :py:attr:`parameters`, which is fixed once the tree is built.'''
+        try:
+            return self._parameter_refs_cache
+        except AttributeError:
+            self._parameter_refs_cache = tuple(
+                (self.tree[id].data, name)
+                for id in self.tree.expand_tree(
+                    key=lambda n: n.data.unique_name
+                )
+                for name in self.tree[id].data.parameter_name
+            )
+            return self._parameter_refs_cache
 
     @property
     def parameters_dict(self):
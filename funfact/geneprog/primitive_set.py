@@ -2,10 +2,10 @@
 # -*- coding: utf-8 -*-
 import uuid
 import inspect
+import random
 from abc import ABC, abstractmethod
-import numpy as np
 from deap import gp
-from funfact.util.iterable import flatten, map_or_call
+from funfact.util.iterable import map_or_call
 from .factorization import Factorization
 
 
@@ -110,6 +110,7 @@ class PrimitiveSet:
         self.ret_type = ret_type
         self.pset = gp.PrimitiveSetTyped('factorization', [], ret_type)
         self.hyperdep = {}
+        self._candidates = {}
 
     @property
     def primitives(self):
@@ -143,6 +144,10 @@ class PrimitiveSet:
     def gen_expr(self, max_depth: int, p=None):
         '''Generate a random nonlinear factorization expression.
 
+        The primitives are drawn using Python's built-in :py:mod:`random`
+        module. To make the generation reproducible, seed it with
+        ``random.seed``; ``np.random.seed`` has no effect.
+
         Parameters
         ----------
         max_depth: int
@@ -156,30 +161,43 @@ class PrimitiveSet:
         expr: list
             An abstract factorization in the form of a prefix expression.
         '''
-        return self._gen_expr_depth_first(
+        expr = []
+        self._gen_expr_depth_first(
+            expr,
             self.ret_type,
             p if p is not None else lambda _: 1.0,
             max_depth
         )
+        return expr
+
+    def _get_candidates(self, t):
+        try:
+            return self._candidates[t]
+        except KeyError:
+            self._candidates[t] = (
+                self.pset.primitives[t] + self.pset.terminals[t]
+            )
+            return self._candidates[t]
 
-    def _gen_expr_depth_first(self, t=None, p=None, d=0):
+    def _gen_expr_depth_first(self, expr, t=None, p=None, d=0):
+        # the candidate lists are short, for which the stdlib RNG has a much
+        # lower per-call overhead than np.random.choice.
         if d <= 0:  # try to terminate ASAP
-            try:
-                choice = np.random.choice(self.pset.terminals[t], 1).item()
-            except ValueError:
-                choice = np.random.choice(self.pset.primitives[t], 1).item()
+            choice = random.choice(
+                self.pset.terminals[t] or self.pset.primitives[t]
+            )
         else:  # normal growth
-            candidates = self.pset.primitives[t] + self.pset.terminals[t]
-            prob = np.fromiter(map_or_call(candidates, p), dtype=np.float)
-            choice = np.random.choice(
-                candidates, 1, p=prob / prob.sum()
-            ).item()
-
-        if isinstance(choice, gp.Terminal):
-            return [choice]
-        else:
-            return [choice, *flatten([self._gen_expr_depth_first(a, p=p, d=d-1)
-                                      for a in choice.args])]
+            candidates = self._get_candidates(t)
+            choice = random.choices(
+                candidates, weights=list(map_or_call(candidates, p)), k=1
+            )[0]
+
+        # append to the shared output list in prefix order rather than
+        # flattening the subexpressions of every level into a new list.
+        expr.append(choice)
+        if not isinstance(choice, gp.Terminal):
+            for a in choice.args:
+                self._gen_expr_depth_first(expr, a, p=p, d=d-1)
 
     def instantiate(self, expr, **hyperparams):
         '''Create a concrete matrix factorization using the given expression.
@@ -199,7 +217,7 @@ class PrimitiveSet:
             the factorization.
         '''
         try:
-            return Factorization(self._instantiate_LL1(expr, **hyperparams)[0])
+            return Factorization(self._instantiate_LL1(expr, **hyperparams))
         except Exception as e:
             raise RuntimeError(
                 f'When instantiating the expression {expr}, the following '
@@ -207,13 +225,20 @@ class PrimitiveSet:
             )
 
     def _instantiate_LL1(self, expr, **hyperparams):
-        primitive, tail_expr = expr[0], expr[1:]
-        children = []
-        for _ in range(primitive.arity):
-            child, tail_expr = self._instantiate_LL1(tail_expr, **hyperparams)
-            children.append(child)
-        prim_def = self.pset.context[primitive.name]
-        return (prim_def(**hyperparams), (*children,)), tail_expr
+        # an explicit stack of (primitive, children) of partially parsed
+        # nodes; a node is instantiated as soon as all its children are, so
+        # the primitives are created in the same post-order as by recursion.
+        stack = []
+        for primitive in expr:
+            stack.append((primitive, []))
+            while len(stack[-1][1]) == stack[-1][0].arity:
+                primitive, children = stack.pop()
+                prim_def = self.pset.context[primitive.name]
+                node = (prim_def(**hyperparams), (*children,))
+                if not stack:
+                    return node
+                stack[-1][1].append(node)
+        raise ValueError(f'Incomplete prefix expression {expr}.')
 
     @staticmethod
     def _get_hyperspecs(f, name):
@@ -318,6 +343,7 @@ class PrimitiveSet:
                 self.pset.addPrimitive(
                     Prim, in_types, ret_type, name=_name
                 )
+            self._candidates.clear()
 
         return decorator
 
@@ -49,7 +49,7 @@ def _einop(spec: str, lhs, rhs, reduction: str, pairwise: str):
         Name of the pairwise operator
     '''
     # parse input spec string
-    lhs_spec, rhs_spec, out_spec, kron_spec = re.split(r'\W+', spec)
+    lhs_spec, rhs_spec, out_spec, kron_spec = re.split(r',|->|\|', spec)
     lhs_spec = list(lhs_spec)
     rhs_spec = list(rhs_spec)
     out_spec = list(out_spec)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import string
 from typing import Optional, Tuple
 from ._base import TranscribeInterpreter
 from funfact.lang._ast import Primitives as P
@@ -7,6 +8,9 @@ from funfact.lang._terminal import AbstractIndex, AbstractTensor, LiteralValue
 
 
 class IndexMap:
+    # 'a'..'z' followed by 'A'..'Z', all valid as einsum subscripts
+    _letters = tuple(string.ascii_letters)
+
     def __init__(self):
         self._index_map = {}
 
@@ -14,7 +18,13 @@ class IndexMap:
         try:
             return self._index_map[idx]
         except KeyError:
-            self._index_map[idx] = chr(97 + len(self._index_map))
+            n = len(self._index_map)
+            if n >= len(self._letters):
+                raise RuntimeError(
+                    f'Cannot map more than {len(self._letters)} distinct '
+                    'indices in a single operation.'
+                )
+            self._index_map[idx] = self._letters[n]
             return self._index_map[idx]
 
     def __call__(self, ids):
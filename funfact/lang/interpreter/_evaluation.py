@@ -1,8 +1,73 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import functools
 import jax.numpy as np
+import opt_einsum
 from ._base import ROOFInterpreter
-from ._einop import _einop
+from ._einop import _einop, DummyBackend
+
+
+@functools.lru_cache(maxsize=1024)
+def _contract_expression(subscripts, *shapes):
+    '''A contraction expression for a given spec and operand shapes, with the
+    contraction path only being searched upon the first request.'''
+    return opt_einsum.contract_expression(
+        subscripts, *shapes, optimize='greedy'
+    )
+
+
+def _alignment(spec, out_spec):
+    '''The transposition and the singleton-axis insertion that make an
+    operand broadcast against the output specification.'''
+    order = sorted(range(len(spec)), key=lambda n: out_spec.index(spec[n]))
+    expand = tuple(slice(None) if c in spec else None for c in out_spec)
+    return order, expand
+
+
+@functools.lru_cache(maxsize=1024)
+def _einplan(spec):
+    '''Classify an einop by its spec string and precompute everything that
+    does not depend on the operand data, so that repeated evaluations of the
+    same node skip the string processing.
+
+    Returns
+    -------
+    kind: str
+        One of 'pairwise' (operands and output share the same index order),
+        'elementwise' (no index reduced), 'tensordot' (all shared indices
+        contracted), 'contract' (contraction with batch indices), or 'einop'
+        (Kronecker indices present).
+    args: tuple
+        Kind-specific precomputed arguments.
+    '''
+    contraction, kron_spec = spec.split('|')
+    if kron_spec:
+        return 'einop', ()
+    in_spec, out_spec = contraction.split('->')
+    lhs_spec, rhs_spec = in_spec.split(',')
+    if lhs_spec == rhs_spec == out_spec:
+        return 'pairwise', ()
+    if set(lhs_spec).union(rhs_spec) <= set(out_spec):
+        return 'elementwise', (
+            _alignment(lhs_spec, out_spec), _alignment(rhs_spec, out_spec)
+        )
+    shared = [c for c in lhs_spec if c in rhs_spec]
+    if set(lhs_spec).symmetric_difference(rhs_spec) <= set(out_spec) and \
+            not set(shared) & set(out_spec):
+        free = [c for c in lhs_spec + rhs_spec if c not in shared]
+        return 'tensordot', (
+            ([lhs_spec.index(c) for c in shared],
+             [rhs_spec.index(c) for c in shared]),
+            [free.index(c) for c in out_spec]
+        )
+    return 'contract', (contraction,)
+
+
+@functools.lru_cache(maxsize=1024)
+def _transpose_axes(einspec):
+    '''The axes permutation of a transposition given by its spec string.'''
+    in_spec, out_spec = einspec.split('->')
+    return tuple(in_spec.index(i) for i in out_spec)
 
 
 class Evaluator(ROOFInterpreter):
@@ -11,6 +76,27 @@ class Evaluator(ROOFInterpreter):
 
     @staticmethod
     def _binary_operator(reduction, pairwise, lhs, rhs, spec):
+        kind, args = _einplan(spec)
+        if kind == 'pairwise':
+            # operands already aligned with the output
+            return getattr(DummyBackend, pairwise)(lhs, rhs)
+        if kind == 'elementwise':
+            # no index to be reduced: a broadcasted elementwise operation
+            (lhs_order, lhs_expand), (rhs_order, rhs_expand) = args
+            return getattr(DummyBackend, pairwise)(
+                np.transpose(lhs, lhs_order)[lhs_expand],
+                np.transpose(rhs, rhs_order)[rhs_expand]
+            )
+        if reduction == 'sum' and pairwise == 'mul':
+            if kind == 'tensordot':
+                # a pure contraction: route to BLAS via tensordot
+                axes, order = args
+                return np.transpose(np.tensordot(lhs, rhs, axes=axes), order)
+            if kind == 'contract':
+                contraction, = args
+                return _contract_expression(
+                    contraction, np.shape(lhs), np.shape(rhs)
+                )(lhs, rhs)
         return _einop(spec, lhs, rhs, reduction, pairwise)
 
     def literal(self, value, **kwargs):
@@ -44,5 +130,4 @@ class Evaluator(ROOFInterpreter):
         return self._binary_operator(reduction, pairwise, lhs, rhs, einspec)
 
     def tran(self, src, indices, einspec, **kwargs):
-        in_spec, out_spec = einspec.split('->')
-        return np.transpose(src, [in_spec.index(i) for i in out_spec])
+        return np.transpose(src, _transpose_axes(einspec))
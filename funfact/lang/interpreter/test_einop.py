@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+import numpy as np
+from ._einop import _einop
+
+
+@pytest.mark.parametrize('pairwise, op', [
+    ('add', np.add),
+    ('sub', np.subtract),
+    ('mul', np.multiply),
+])
+def test_einop_scalar_output(pairwise, op):
+    rng = np.random.default_rng(0)
+    lhs = rng.normal(size=(2, 3)).astype(np.float32)
+    rhs = rng.normal(size=(2, 3)).astype(np.float32)
+    out = _einop('ab,ab->|', lhs, rhs, 'sum', pairwise)
+    assert np.shape(out) == ()
+    assert np.allclose(out, op(lhs, rhs).sum(), atol=1e-5)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+import numpy as np
+from ._evaluation import _einplan, _transpose_axes, Evaluator
+
+
+@pytest.mark.parametrize('spec, kind', [
+    ('ab,ab->ab|', 'pairwise'),
+    ('ab,ab->ba|', 'elementwise'),
+    ('ab,c->acb|', 'elementwise'),
+    ('ab,bc->ac|', 'tensordot'),
+    ('ab,ab->|', 'tensordot'),
+    ('abc,bc->ac|', 'contract'),
+    ('ab,b->|', 'contract'),
+    ('ab,ab->ab|a', 'einop'),
+])
+def test_einplan(spec, kind):
+    assert _einplan(spec)[0] == kind
+
+
+@pytest.mark.parametrize('spec, lhs_shape, rhs_shape', [
+    ('ab,ab->ab|', (2, 3), (2, 3)),
+    ('ab,ab->ba|', (2, 3), (2, 3)),
+    ('ab,c->acb|', (2, 3), (4,)),
+    ('ab,bc->ac|', (2, 3), (3, 4)),
+    ('ab,bc->ca|', (2, 3), (3, 4)),
+    ('ab,ab->|', (2, 3), (2, 3)),
+    ('abc,bc->ac|', (2, 3, 4), (3, 4)),
+    ('abc,bc->cba|', (2, 3, 4), (3, 4)),
+])
+def test_binary_operator(spec, lhs_shape, rhs_shape):
+    rng = np.random.default_rng(0)
+    lhs = rng.normal(size=lhs_shape).astype(np.float32)
+    rhs = rng.normal(size=rhs_shape).astype(np.float32)
+    contraction = spec.split('|')[0]
+    out = Evaluator._binary_operator('sum', 'mul', lhs, rhs, spec)
+    ref = np.einsum(contraction, lhs, rhs)
+    assert out.shape == ref.shape
+    assert np.allclose(out, ref, atol=1e-5)
+
+
+@pytest.mark.parametrize('einspec, axes', [
+    ('ab->ab', (0, 1)),
+    ('ab->ba', (1, 0)),
+    ('abc->cab', (2, 0, 1)),
+])
+def test_transpose_axes(einspec, axes):
+    assert _transpose_axes(einspec) == axes
+
+
+@pytest.mark.parametrize('pairwise, op', [
+    ('add', np.add),
+    ('sub', np.subtract),
+])
+def test_binary_operator_pairwise(pairwise, op):
+    rng = np.random.default_rng(0)
+    lhs = rng.normal(size=(2, 3)).astype(np.float32)
+    rhs = rng.normal(size=(2, 3)).astype(np.float32)
+    out = Evaluator._binary_operator('sum', pairwise, lhs, rhs, 'ab,ab->ab|')
+    assert np.allclose(out, op(lhs, rhs))
@@ -1,12 +1,46 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from collections import namedtuple
+import math
 import dill
+import numba
 import numpy as np
 import pycuda.driver as cuda
 from funfact.cuda import context_manager, ManagedArray
 
 
+@numba.njit(parallel=True, fastmath=True)
+def _rbf_eval(u, v, a, b, out):
+    '''Evaluate an ensemble of RBF expansions into ``out`` in a single fused
+    pass, without materializing the (N, M, R, E) pairwise differences.'''
+    N, R, E = u.shape
+    M = v.shape[0]
+    for i in numba.prange(N):
+        for j in range(M):
+            for e in range(E):
+                s = 0.0
+                for r in range(R):
+                    d = u[i, r, e] - v[j, r, e]
+                    s += math.exp(-d * d) * a[r, e]
+                out[i, j, e] = s + b[e]
+    return out
+
+
+def _rbf_cpu(u, v, a, b):
+    '''CPU evaluation of RBF expansions, possibly with the trailing ensemble
+    axis being sliced away as done by :py:meth:`Model.__call__`.'''
+    runs = np.shape(b)
+    u, v, a, b = [
+        np.reshape(w, np.shape(w)[:np.ndim(w) - len(runs)] + (-1,))
+        for w in (u, v, a, b)
+    ]
+    out = np.empty(
+        (len(u), len(v), b.shape[-1]),
+        dtype=np.result_type(u, v, a, b)
+    )
+    return np.reshape(_rbf_eval(u, v, a, b, out), out.shape[:2] + runs)
+
+
 class RBFExpansionBasePyCUDA:
 
     def __init__(self):
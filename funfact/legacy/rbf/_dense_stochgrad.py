@@ -7,7 +7,7 @@ from funfact.cpp import get_cpp_file, Template
 from funfact.cuda import jit, context_manager, ManagedArray
 import funfact.optim as optim
 
-from ._base import RBFExpansionBasePyCUDA
+from ._base import RBFExpansionBasePyCUDA, _rbf_cpu
 
 
 class RBFExpansionDenseStochasticGrad(RBFExpansionBasePyCUDA):
@@ -152,14 +152,7 @@ class RBFExpansionDenseStochasticGrad(RBFExpansionBasePyCUDA):
             # rbf,
             u, v, a, b
         ):
-            return np.sum(
-                np.exp(
-                    -np.square(
-                        u[:, None, ...] - v[None, :, ...]
-                    )
-                ) * a[None, None, ...],
-                axis=2
-            ) + b[None, None, ...]
+            return _rbf_cpu(u, v, a, b)
 
         self.report = self._grad_opt(
             f_cuda, (u, v, a, b), plugins
@@ -235,14 +228,7 @@ class RBFExpansionDenseStochasticGrad(RBFExpansionBasePyCUDA):
             # rbf,
             u, a, b
         ):
-            return np.sum(
-                np.exp(
-                    -np.square(
-                        u[:, None, ...] - u[None, :, ...]
-                    )
-                ) * a[None, None, ...],
-                axis=2
-            ) + b[None, None, ...]
+            return _rbf_cpu(u, u, a, b)
 
         self.report = self._grad_opt(
             f_cuda, (u, a, b), plugins
@@ -1,14 +1,26 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import numpy as np
+import pycuda.driver as cuda
 import scipy.sparse as sp
 import tqdm
 
 from funfact.cpp import get_cpp_file, Template
-from funfact.cuda import jit, context_manager, ManagedArray
+from funfact.cuda import jit_module, ManagedArray
 import funfact.optim as optim
 
-from ._base import RBFExpansionBasePyCUDA
+from ._base import RBFExpansionBasePyCUDA, _rbf_cpu
+
+
+def _as_bf16(x):
+    '''Round FP32 values to the nearest BF16 ones and return their bit patterns
+    as uint16. NaNs are mapped to quiet NaNs of the same sign, since rounding
+    could carry a payload in the low bits into an infinity or a zero.'''
+    x = np.asarray(x, dtype=np.float32)
+    bits = x.view(np.uint32)
+    rounded = (bits + (0x7FFF + ((bits >> 16) & 1))) >> 16
+    sign = (bits >> 16) & 0x8000
+    return np.where(np.isnan(x), 0x7FC0 | sign, rounded).astype(np.uint16)
 
 
 class RBFExpansionSparseStochasticGrad(RBFExpansionBasePyCUDA):
@@ -91,6 +103,32 @@ class RBFExpansionSparseStochasticGrad(RBFExpansionBasePyCUDA):
             ))
             return self._src
 
+    _kernel_cache = {}
+
+    def _get_kernels(self, **sizes):
+        '''JIT-compiled kernels for the stochastic gradient and for the
+        hitmap of non-zeros. The kernels are cached across fits that share the
+        same CUDA context, problem sizes and CUDA launch configuration.'''
+        key = (
+            cuda.Context.get_current(),
+            *sorted(sizes.items()),
+            self.cuda_thread_per_block,
+            self.cuda_block_per_inst
+        )
+        try:
+            return self._kernel_cache[key]
+        except KeyError:
+            module = jit_module(self.src.render(
+                **sizes,
+                thread_per_block=self.cuda_thread_per_block,
+                block_per_inst=self.cuda_block_per_inst
+            ))
+            self._kernel_cache[key] = [
+                module.get_function('rbf_expansion_ensemble_sparse_stochgrad'),
+                module.get_function('rbf_expansion_ensemble_sparse_hitmap')
+            ]
+            return self._kernel_cache[key]
+
     def fit(
         self, target, seed=None, plugins=[], u0=None, v0=None, a0=None, b0=None
     ):
@@ -118,27 +156,29 @@ class RBFExpansionSparseStochasticGrad(RBFExpansionBasePyCUDA):
         hitmap = ManagedArray.zeros(((NH + 31) // 32,), dtype=np.int32,
                                     order='F')
         nz_values = self._as_cuda_array(V, dtype=np.float32, order='F')
-        nz_indices = self._as_cuda_array(
-            np.array(
-                list(zip(I, J)),
-                dtype=[
-                    ('i', np.int32),
-                    ('j', np.int32)
-                ]
-            )
-        )
-        print(nz_indices)
+        nz_i = self._as_cuda_array(I, dtype=np.int32, order='F')
+        nz_j = self._as_cuda_array(J, dtype=np.int32, order='F')
 
         u0 = rng.normal(0.0, 0.1, (N, R, E)) if u0 is None else u0
         v0 = rng.normal(0.0, 0.1, (M, R, E)) if v0 is None else v0
         a0 = rng.normal(0.0, np.std(V) / np.sqrt(R),
                         (R, E)) if a0 is None else a0
         b0 = rng.normal(0.0, 1.0, (E,)) if b0 is None else b0
+        # draw the per-step RNG keys of all ensemble instances in bulk, after
+        # the initial parameters so that those stay the same for a given seed
+        rng_keys = iter(
+            rng.integers(0, 2**32, (self.max_steps, E), dtype=np.uint32)
+        )
 
-        u = self._as_cuda_array(u0, dtype=np.float32, order='F')
-        v = self._as_cuda_array(v0, dtype=np.float32, order='F')
-        a = self._as_cuda_array(a0, dtype=np.float32, order='F')
-        b = self._as_cuda_array(b0, dtype=np.float32, order='F')
+        # FP32 master copies on the host, BF16 copies on the device
+        u = np.array(u0, dtype=np.float32, order='F')
+        v = np.array(v0, dtype=np.float32, order='F')
+        a = np.array(a0, dtype=np.float32, order='F')
+        b = np.array(b0, dtype=np.float32, order='F')
+        u_dev = ManagedArray.empty(u.shape, dtype=np.uint16, order='F')
+        v_dev = ManagedArray.empty(v.shape, dtype=np.uint16, order='F')
+        a_dev = ManagedArray.empty(a.shape, dtype=np.uint16, order='F')
+        b_dev = ManagedArray.empty(b.shape, dtype=np.uint16, order='F')
 
         L = ManagedArray.zeros((E,), dtype=np.float32, order='F')
         du = ManagedArray.zeros((N, R, E), dtype=np.float32, order='F')
@@ -146,57 +186,49 @@ class RBFExpansionSparseStochasticGrad(RBFExpansionBasePyCUDA):
         da = ManagedArray.zeros((R, E), dtype=np.float32, order='F')
         db = ManagedArray.zeros((E,), dtype=np.float32, order='F')
 
-        kernels = [
-            jit(
-                self.src.render(
-                    E=E, N=N, M=M, R=R, NNZ=NNZ, NH=NH, GOAL=GOAL,
-                    thread_per_block=self.cuda_thread_per_block,
-                    block_per_inst=self.cuda_block_per_inst
-                ),
-                f'rbf_expansion_ensemble_sparse_stochgrad_{GOAL}'
-            )
-            for GOAL in ['SamplingNonZeros', 'SamplingZeros']
-        ]
+        kernel, hitmap_kernel = self._get_kernels(
+            E=E, N=N, M=M, R=R, NNZ=NNZ, NH=NH
+        )
+        stream = cuda.Stream()
+
+        hitmap_kernel(
+            hitmap, nz_i, nz_j,
+            block=(self.cuda_thread_per_block, 1, 1),
+            grid=((NNZ + self.cuda_thread_per_block - 1)
+                  // self.cuda_thread_per_block, 1),
+            stream=stream
+        )
+        stream.synchronize()
 
         def f_cuda(x):
-            u, v, a, b = x
-            u = self._as_cuda_array(u, dtype=np.float32, order='F')
-            v = self._as_cuda_array(v, dtype=np.float32, order='F')
-            a = self._as_cuda_array(a, dtype=np.float32, order='F')
-            b = self._as_cuda_array(b, dtype=np.float32, order='F')
-            self._zero_cuda_array(hitmap)
+            # update the managed parameter buffers in place
+            for w_dev, w in zip((u_dev, v_dev, a_dev, b_dev), x):
+                w_dev[...] = _as_bf16(w)
             self._zero_cuda_array(L)
             self._zero_cuda_array(du)
             self._zero_cuda_array(dv)
             self._zero_cuda_array(da)
             self._zero_cuda_array(db)
-            rng_key[:] = rng.integers(0, 2**32, E)
-
-            for kernel, n in zip(kernels, minibatch_sizes):
-                kernel(
-                    rng_key, hitmap, nz_indices, nz_values,
-                    u, v, a, b, L, du, dv, da, db,
-                    np.int32(n),
-                    block=(self.cuda_thread_per_block, 1, 1),
-                    grid=(self.cuda_block_per_inst, self.ensemble_size)
-                )
+            rng_key[:] = next(rng_keys)
+
+            kernel(
+                rng_key, hitmap, nz_i, nz_j, nz_values,
+                u_dev, v_dev, a_dev, b_dev, L, du, dv, da, db,
+                *[np.int32(n) for n in minibatch_sizes],
+                block=(self.cuda_thread_per_block, 1, 1),
+                grid=(2 * self.cuda_block_per_inst, self.ensemble_size),
+                stream=stream
+            )
 
-            context_manager.context.synchronize()
+            stream.synchronize()
 
-            return np.copy(L), (du, dv, da, db)
+            return L, (du, dv, da, db)
 
         def f_cpu(
             # rbf,
             u, v, a, b
         ):
-            return np.sum(
-                np.exp(
-                    -np.square(
-                        u[:, None, ...] - v[None, :, ...]
-                    )
-                ) * a[None, None, ...],
-                axis=2
-            ) + b[None, None, ...]
+            return _rbf_cpu(u, v, a, b)
 
         self.report = self._grad_opt(
             f_cuda, (u, v, a, b), plugins
@@ -236,78 +268,68 @@ class RBFExpansionSparseStochasticGrad(RBFExpansionBasePyCUDA):
         hitmap = ManagedArray.zeros(((NH + 31) // 32,), dtype=np.int32,
                                     order='F')
         nz_values = self._as_cuda_array(V, dtype=np.float32, order='F')
-        nz_indices = self._as_cuda_array(
-            np.array(
-                list(zip(I, J)),
-                dtype=[
-                    ('i', np.int32),
-                    ('j', np.int32)
-                ]
-            )
-        )
-        print(nz_indices)
+        nz_i = self._as_cuda_array(I, dtype=np.int32, order='F')
+        nz_j = self._as_cuda_array(J, dtype=np.int32, order='F')
 
         u0 = rng.normal(0.0, 0.1, (N, R, E)) if u0 is None else u0
         a0 = rng.normal(0.0, np.std(V) / np.sqrt(R),
                         (R, E)) if a0 is None else a0
         b0 = rng.normal(0.0, 1.0, (E,)) if b0 is None else b0
 
-        u = self._as_cuda_array(u0, dtype=np.float32, order='F')
-        a = self._as_cuda_array(a0, dtype=np.float32, order='F')
-        b = self._as_cuda_array(b0, dtype=np.float32, order='F')
+        # FP32 master copies on the host, BF16 copies on the device
+        u = np.array(u0, dtype=np.float32, order='F')
+        a = np.array(a0, dtype=np.float32, order='F')
+        b = np.array(b0, dtype=np.float32, order='F')
+        u_dev = ManagedArray.empty(u.shape, dtype=np.uint16, order='F')
+        a_dev = ManagedArray.empty(a.shape, dtype=np.uint16, order='F')
+        b_dev = ManagedArray.empty(b.shape, dtype=np.uint16, order='F')
 
         L = ManagedArray.zeros((E,), dtype=np.float32, order='F')
         du = ManagedArray.zeros((N, R, E), dtype=np.float32, order='F')
         da = ManagedArray.zeros((R, E), dtype=np.float32, order='F')
         db = ManagedArray.zeros((E,), dtype=np.float32, order='F')
 
-        kernels = [
-            jit(
-                self.src.render(
-                    E=E, N=N, M=M, R=R, NNZ=NNZ, NH=NH, GOAL=GOAL,
-                    thread_per_block=self.cuda_thread_per_block,
-                    block_per_inst=self.cuda_block_per_inst
-                ),
-                f'rbf_expansion_ensemble_sparse_stochgrad_{GOAL}'
-            )
-            for GOAL in ['SamplingNonZeros', 'SamplingZeros']
-        ]
+        kernel, hitmap_kernel = self._get_kernels(
+            E=E, N=N, M=M, R=R, NNZ=NNZ, NH=NH
+        )
+        stream = cuda.Stream()
+
+        hitmap_kernel(
+            hitmap, nz_i, nz_j,
+            block=(self.cuda_thread_per_block, 1, 1),
+            grid=((NNZ + self.cuda_thread_per_block - 1)
+                  // self.cuda_thread_per_block, 1),
+            stream=stream
+        )
+        stream.synchronize()
 
         def f_cuda(x):
-            u, a, b = x
-            u = self._as_cuda_array(u, dtype=np.float32, order='F')
-            a = self._as_cuda_array(a, dtype=np.float32, order='F')
-            b = self._as_cuda_array(b, dtype=np.float32, order='F')
+            # update the managed parameter buffers in place
+            for w_dev, w in zip((u_dev, a_dev, b_dev), x):
+                w_dev[...] = _as_bf16(w)
             self._zero_cuda_array(L)
             self._zero_cuda_array(du)
             self._zero_cuda_array(da)
             self._zero_cuda_array(db)
 
-            for kernel, n in zip(kernels, minibatch_sizes):
-                kernel(
-                    rng_key, hitmap, nz_indices, nz_values,
-                    u, u, a, b, L, du, du, da, db,
-                    np.int32(n),
-                    block=(self.cuda_thread_per_block, 1, 1),
-                    grid=(self.cuda_block_per_inst, self.ensemble_size)
-                )
+            kernel(
+                rng_key, hitmap, nz_i, nz_j, nz_values,
+                u_dev, u_dev, a_dev, b_dev, L, du, du, da, db,
+                *[np.int32(n) for n in minibatch_sizes],
+                block=(self.cuda_thread_per_block, 1, 1),
+                grid=(2 * self.cuda_block_per_inst, self.ensemble_size),
+                stream=stream
+            )
 
-            context_manager.context.synchronize()
+            stream.synchronize()
 
-            return np.copy(L), (du, da, db)
+            return L, (du, da, db)
 
         def f_cpu(
             # rbf,
             u, a, b
         ):
-            return np.sum(
-                np.exp(
-                    -np.square(
-                        u[:, None, ...] - u[None, :, ...]
-                    )
-                ) * a[None, None, ...],
-                axis=2
-            ) + b[None, None, ...]
+            return _rbf_cpu(u, u, a, b)
 
         self.report = self._grad_opt(
             f_cuda, (u, a, b), plugins
@@ -332,26 +354,27 @@ class RBFExpansionSparseStochasticGrad(RBFExpansionBasePyCUDA):
         report = {}
         report['x_best'] = [np.copy(w) for w in x]
         report['t_best'] = np.zeros(self.ensemble_size, dtype=np.int64)
-        report['loss_history'] = []
+        report['loss_best'] = np.full(
+            self.ensemble_size, np.inf, dtype=np.float32
+        )
+        report['loss_history'] = np.empty(
+            (self.max_steps, self.ensemble_size), dtype=np.float32
+        )
         report['loss_history_ticks'] = []
 
         for step in self.progressbar(self.max_steps):
             loss, grad = f(x)
 
+            # f may reuse its loss buffer, keep the copy in the history
             report['loss_history_ticks'].append(step)
-            report['loss_history'].append(loss)
+            report['loss_history'][step] = loss
+            loss = report['loss_history'][step]
 
-            if 'loss_best' in report:
-                report['loss_best'] = np.minimum(
-                    report['loss_best'], loss
-                )
-            else:
-                report['loss_best'] = loss
-
-            better = np.flatnonzero(report['loss_best'] == loss)
+            better = loss <= report['loss_best']
+            np.minimum(report['loss_best'], loss, out=report['loss_best'])
             report['t_best'][better] = step
             for current, new in zip(report['x_best'], x):
-                current[..., better] = new[..., better]
+                np.copyto(current, new, where=better)
 
             for plugin in plugins:
                 if step % plugin['every'] == 0:
@@ -368,8 +391,4 @@ class RBFExpansionSparseStochasticGrad(RBFExpansionBasePyCUDA):
 
             opt.step(grad)
 
-        report['loss_history'] = np.array(
-            report['loss_history'], dtype=np.float
-        )
-
         return report
@@ -38,6 +38,7 @@ setup(
         'scipy>=1.7.1',
         'asciitree>=0.3.3',
         'jax[cpu]>=0.2.24',
+        'opt_einsum>=3.3',
     ],
     extras_require={
         'docs': [